@@ -3,8 +3,20 @@
 
 import os
 import re
+import json
+import time
+import asyncio
+import hashlib
+import pickle
+import random
+import tempfile
+from collections import Counter, OrderedDict
 from dotenv import load_dotenv
 import google.generativeai as genai
+from google.api_core import exceptions as api_exceptions
+from config import AI_SEARCH_DEPTH, AI_ROUTING_MARGIN
+from engine import ALL_SQUARES, generate_moves
+from pieces import JUMPED_SQUARE, NUM_SQUARES
 
 # Load environment variables from a .env file
 load_dotenv()
@@ -12,62 +24,468 @@ load_dotenv()
 # The API key is now passed directly to the client
 API_KEY = os.getenv("GEMINI_API_KEY")
 
+# Flash-Lite answers without a thinking phase by default, so the tiny output cap below holds the
+# whole reply; a model that thinks by default would spend that cap on thinking tokens and return no text
+MODEL_NAME = "gemini-2.5-flash-lite"
+
+# Static instructions are sent once as the model's system instruction rather than with every move
+SYSTEM_INSTRUCTION = (
+    "You are a checkers engine. Reply ONLY with the best move as 'start-end' (e.g. '11-15'), "
+    "with no commentary.\n"
+    "Positions are PDN: [turn:red pieces:black pieces], turn R or B, a K prefix marks a king. "
+    "For example [R:21,K30:9,10] means Red to move, Red men on 21 and a king on 30, Black men on 9 and 10. "
+    "Squares are numbered 1-32 from the top-left; Black starts on 1-12 and Red on 21-32.\n"
+    "Rules: men move diagonally forward one square (Red up, Black down); kings move diagonally "
+    "either way; a capture must be taken if available; a man reaching the far row becomes a king."
+)
+
+# One short, deterministic line is all a move needs
+GENERATION_SETTINGS = {
+    "max_output_tokens": 8,
+    "temperature": 0.0,
+    "stop_sequences": ["\n"],
+}
+GENERATION_CONFIG = genai.GenerationConfig(**GENERATION_SETTINGS)
+
+# Each request gets a hard timeout; rate limits and server-side failures are retried with jittered
+# exponential backoff, while other client errors (bad request, auth) are raised immediately
+REQUEST_TIMEOUT_SECONDS = 8.0
+REQUEST_MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+RETRYABLE_ERRORS = (
+    api_exceptions.ResourceExhausted,  # 429
+    api_exceptions.InternalServerError,  # 500
+    api_exceptions.ServiceUnavailable,  # 503
+    api_exceptions.DeadlineExceeded,  # 504, or our own timeout
+)
+
+# Batch jobs are billed at a discount but can take up to 24 hours, so they are polled slowly
+BATCH_POLL_SECONDS = 30
+BATCH_FINISHED_STATES = {"JOB_STATE_SUCCEEDED", "JOB_STATE_FAILED", "JOB_STATE_CANCELLED", "JOB_STATE_EXPIRED"}
+
+# Moves already returned for a position are remembered across runs
+CACHE_PATH = os.path.expanduser("~/.checkers_ai_cache.pkl")
+CACHE_MAX_SIZE = 4096
+
+# Matches a move such as '11-15' anywhere in the model's reply
+_MOVE_RE = re.compile(r'(\d+)-(\d+)')
+
+# --- Local Search ---
+# Positions are (red_men, red_kings, black_men, black_kings, red_to_move) bitboard tuples
+MAN_VALUE = 100
+KING_VALUE = 150
+WIN_SCORE = 100000
+RED_PROMOTION_SQUARES = 0b1111  # Squares 1-4
+BLACK_PROMOTION_SQUARES = 0b1111 << 28  # Squares 29-32
+
+
+def _parse_pdn(pdn_string):
+    """
+    Parses a PDN string produced by Game.to_pdn into a bitboard position, raising ValueError if the
+    string is not in that format.
+    """
+    turn, red_pieces, black_pieces = pdn_string.strip('[]').split(':')
+    if turn not in ('R', 'B'):
+        raise ValueError(f"Unknown side to move: {turn!r}")
+    bitboards = [0, 0, 0, 0]
+    for offset, pieces in ((0, red_pieces), (2, black_pieces)):
+        for piece in filter(None, pieces.split(',')):
+            is_king = piece.startswith('K')
+            square = int(piece[is_king:])
+            if not 1 <= square <= NUM_SQUARES or any(bitboard >> (square - 1) & 1 for bitboard in bitboards):
+                raise ValueError(f"Invalid or repeated square: {piece!r}")
+            bitboards[offset + is_king] |= 1 << (square - 1)
+    return (*bitboards, turn == 'R')
+
+
+def _legal_moves(position):
+    """Returns the legal (start_square, end_square) moves for the side to move."""
+    red_men, red_kings, black_men, black_kings, red_to_move = position
+    empty = ~(red_men | red_kings | black_men | black_kings) & ALL_SQUARES
+    if red_to_move:
+        return generate_moves(red_men, red_kings, black_men | black_kings, empty, True)
+    return generate_moves(black_men, black_kings, red_men | red_kings, empty, False)
+
+
+def _apply_move(position, move):
+    """Returns the position after a move, following the engine's capture and promotion rules."""
+    red_men, red_kings, black_men, black_kings, red_to_move = position
+    if red_to_move:
+        own_men, own_kings, enemy_men, enemy_kings = red_men, red_kings, black_men, black_kings
+    else:
+        own_men, own_kings, enemy_men, enemy_kings = black_men, black_kings, red_men, red_kings
+
+    start, end = move
+    start_bit, end_bit = 1 << start, 1 << end
+    captured_square = JUMPED_SQUARE.get(move)
+    if captured_square is not None:
+        enemy_men &= ~(1 << captured_square)
+        enemy_kings &= ~(1 << captured_square)
+
+    if own_men & start_bit:
+        own_men ^= start_bit
+        promotion_squares = RED_PROMOTION_SQUARES if red_to_move else BLACK_PROMOTION_SQUARES
+        if end_bit & promotion_squares:
+            own_kings |= end_bit
+        else:
+            own_men |= end_bit
+    else:
+        own_kings ^= start_bit | end_bit
+
+    if red_to_move:
+        return own_men, own_kings, enemy_men, enemy_kings, False
+    return enemy_men, enemy_kings, own_men, own_kings, True
+
+
+def _evaluate(position):
+    """Material balance from the point of view of the side to move."""
+    red_men, red_kings, black_men, black_kings, red_to_move = position
+    score = (MAN_VALUE * (red_men.bit_count() - black_men.bit_count())
+             + KING_VALUE * (red_kings.bit_count() - black_kings.bit_count()))
+    return score if red_to_move else -score
+
+
+def _negamax(position, depth, alpha, beta):
+    """Alpha-beta negamax search; a side with no legal moves has lost."""
+    moves = _legal_moves(position)
+    if not moves:
+        return -WIN_SCORE - depth  # Prefer the quickest win and the slowest loss
+    if depth == 0:
+        return _evaluate(position)
+    for move in moves:
+        score = -_negamax(_apply_move(position, move), depth - 1, -beta, -alpha)
+        if score >= beta:
+            return score
+        alpha = max(alpha, score)
+    return alpha
+
+
+def _score_moves(position, moves, depth):
+    """Scores each move with a full-window search, returning (score, move) pairs best first."""
+    scored = [(-_negamax(_apply_move(position, move), depth - 1, -2 * WIN_SCORE, 2 * WIN_SCORE), move)
+              for move in moves]
+    return sorted(scored, key=lambda item: item[0], reverse=True)
+
+
+def _format_move(move):
+    """Formats a (start_square, end_square) pair as a PDN move such as '11-15'."""
+    return f"{move[0] + 1}-{move[1] + 1}"
+
+
+def _is_legal_move(pdn_string, move):
+    """Checks whether a PDN move such as '11-15' is legal in the given position."""
+    return move in {_format_move(legal_move) for legal_move in _legal_moves(_parse_pdn(pdn_string))}
+
+
 class AIPlayer:
     """
     An AI player that uses a Google Gemini model to decide on a checkers move.
     """
     def __init__(self):
-        """Initializes the Gemini client."""
+        """Initializes the Gemini client and loads the move cache."""
+        self._exact_cache = self._load_cache()
         try:
             if not API_KEY:
                 raise ValueError("GEMINI_API_KEY not found in .env file.")
             genai.configure(api_key=API_KEY)
-            self.model = genai.GenerativeModel("gemini-pro")
+            self.model = genai.GenerativeModel(
+                MODEL_NAME,
+                system_instruction=SYSTEM_INSTRUCTION,
+                generation_config=GENERATION_CONFIG,
+            )
             print("Gemini AI Player initialized successfully.")
         except Exception as e:
             print(f"ERROR: Could not initialize Gemini client: {e}")
-            self.client = None
+            self.model = None
 
-    def get_best_move(self, pdn_string):
+    async def get_best_move(self, pdn_string):
         """
         Given the current board state in PDN, asks the AI for the best move via the Gemini API.
+        This is a coroutine so the GUI can await the network call without blocking rendering.
+        Positions that were answered before are served from the cache, and easy positions are
+        decided by a local search; Gemini only chooses among the search's near-best candidates.
         """
+        cache_key = self._hash(pdn_string)
+        cached_move = self._get_cached_move(cache_key, pdn_string)
+        if cached_move:
+            return cached_move
+
+        local_move, candidates = self._route_locally(pdn_string)
+        if local_move or not candidates:
+            return local_move
+
         if not self.model:
             print(f"ERROR: Gemini client not initialized.")
-            return None
+            return candidates[0]
+
+        prompt = self._build_prompt(pdn_string, candidates)
+
+        try:
+            move = await self._request_move(prompt)
+        except Exception as e:
+            print(f"ERROR: An API request error occurred: {e}")
+            return candidates[0]
+
+        if move not in candidates:
+            if move:
+                print(f"ERROR: AI suggested a move that is not a candidate: {move}")
+            return candidates[0]
+        self._cache_move(cache_key, move)
+        return move
+
+    async def get_best_move_ensemble(self, pdn_string, n=3):
+        """
+        Asks the model for n moves at temperatures spread between 0 and 1 and returns the majority vote.
+        The requests are issued concurrently, so this takes about as long as the slowest single call.
+        """
+        cache_key = self._hash(pdn_string)
+        cached_move = self._get_cached_move(cache_key, pdn_string)
+        if cached_move:
+            return cached_move
+
+        local_move, candidates = self._route_locally(pdn_string)
+        if local_move or not candidates:
+            return local_move
+
+        if not self.model:
+            print(f"ERROR: Gemini client not initialized.")
+            return candidates[0]
 
-        prompt = (
-            "You are a helpful checkers assistant. Your goal is to identify the best possible move. "
-            "You must respond ONLY with the move in the format 'start_square-end_square' (e.g., '11-15' or '22-25'). "
-            "Do not add any commentary or explanation.\n\n"
-            "The board state is provided in PDN format. For example: [R:K1,2,3:B4,5,6] means it is Red's turn to move, Red has kings on squares 1, 2, and 3, and Black has men on squares 4, 5, and 6." 
-            "The squares are numbered 1-32, starting from the top-left of the board.\n\n"
-            "Remember the rules of checkers:"
-            "1. Men move forward diagonally one square at a time."
-            "2. Kings can move forward or backward diagonally."
-            "3. If a capture is available, it must be taken."
-            "4. A piece is crowned a king when it reaches the opponent's back row.\n\n"
-            f"User: Given the PDN string '{pdn_string}', what is the best move for the current player?\n"
-            "Model:"
+        prompt = self._build_prompt(pdn_string, candidates)
+        configs = [genai.GenerationConfig(temperature=i / max(n - 1, 1)) for i in range(n)]
+        results = await asyncio.gather(
+            *(self._request_move(prompt, config) for config in configs),
+            return_exceptions=True,
         )
 
+        votes = Counter()
+        for move in results:
+            if isinstance(move, Exception):
+                print(f"ERROR: An API request error occurred: {move}")
+                continue
+            if move in candidates:
+                votes[move] += 1
+
+        if not votes:
+            return candidates[0]
+        move = votes.most_common(1)[0][0]
+        self._cache_move(cache_key, move)
+        return move
+
+    def get_best_moves_batch(self, pdn_strings):
+        """
+        Finds moves for many positions at once through the Gemini Batch API, for offline work such as
+        analysing game archives. This blocks until the batch job finishes. Cached positions and those
+        _route_locally can decide are answered without Gemini; only the rest are submitted, each
+        with its candidate moves, and a reply outside that list is discarded. Returns a list of moves aligned with
+        pdn_strings, with None wherever no move could be found or the PDN string is malformed.
+        """
+        keys = [self._hash(pdn_string) for pdn_string in pdn_strings]
+        moves = {}
+        pending = {}
+        for key, pdn_string in zip(keys, pdn_strings):
+            # Reject malformed positions up front so one bad string cannot discard a finished job
+            try:
+                _parse_pdn(pdn_string)
+            except ValueError as e:
+                print(f"ERROR: Skipping malformed PDN string {pdn_string!r}: {e}")
+                continue
+            cached_move = self._get_cached_move(key, pdn_string)
+            if cached_move:
+                moves[key] = cached_move
+                continue
+            local_move, candidates = self._route_locally(pdn_string)
+            if local_move or not candidates:
+                moves[key] = local_move
+            else:
+                pending[key] = (pdn_string, candidates)
+
+        if pending:
+            prompts = {key: self._build_prompt(pdn_string, candidates)
+                       for key, (pdn_string, candidates) in pending.items()}
+            try:
+                batch_moves = self._run_batch_job(prompts)
+            except Exception as e:
+                print(f"ERROR: A batch request error occurred: {e}")
+                batch_moves = {}
+            for key, move in list(batch_moves.items()):
+                if move not in pending[key][1]:
+                    print(f"ERROR: Batch result suggested a move that is not a candidate: {move}")
+                    del batch_moves[key]
+                    continue
+                self._cache_move(key, move, persist=False)
+            self._save_cache()
+            moves.update(batch_moves)
+
+        return [moves.get(key) for key in keys]
+
+    def _run_batch_job(self, prompts):
+        """Submits one batch job for the given {cache_key: prompt} requests and returns {cache_key: move}."""
+        if not API_KEY:
+            print(f"ERROR: Gemini client not initialized.")
+            return {}
+        # The Batch API needs the newer google-genai SDK; it is only loaded for offline batch work
+        from google.genai import Client as BatchClient, types as batch_types
+        client = BatchClient(api_key=API_KEY)
+
+        # Each line of the input file is one request, tagged with its cache key
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as f:
+            for key, prompt in prompts.items():
+                request = {
+                    "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+                    "system_instruction": {"parts": [{"text": SYSTEM_INSTRUCTION}]},
+                    "generation_config": GENERATION_SETTINGS,
+                }
+                f.write(json.dumps({"key": key, "request": request}) + "\n")
+            input_path = f.name
         try:
-            response = self.model.generate_content(prompt)
+            input_file = client.files.upload(
+                file=input_path, config=batch_types.UploadFileConfig(mime_type="jsonl"))
+        finally:
+            os.remove(input_path)
 
-            if not response.candidates:
-                finish_reason = response.candidates[0].finish_reason if response.candidates else 'UNKNOWN'
-                print(f"ERROR: Gemini response was blocked or empty. Finish Reason: {finish_reason}")
-                return None
+        job = client.batches.create(model=MODEL_NAME, src=input_file.name)
+        while job.state.name not in BATCH_FINISHED_STATES:
+            time.sleep(BATCH_POLL_SECONDS)
+            job = client.batches.get(name=job.name)
 
-            response_text = response.text.strip()
-            match = re.search(r'\d+-\d+', response_text)
+        if job.state.name != "JOB_STATE_SUCCEEDED":
+            print(f"ERROR: Batch job {job.name} finished with state {job.state.name}")
+            return {}
 
+        moves = {}
+        output = client.files.download(file=job.dest.file_name).decode()
+        for line in output.splitlines():
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            candidates = result.get("response", {}).get("candidates") or [{}]
+            parts = candidates[0].get("content", {}).get("parts", [])
+            match = _MOVE_RE.search("".join(part.get("text", "") for part in parts))
             if match:
-                return match.group(0)
+                moves[result["key"]] = match.group(0)
             else:
-                print(f"ERROR: Could not find a valid move in AI response: '{response_text}'")
-                return None
+                print(f"ERROR: Could not find a valid move in batch result for key {result.get('key')}")
+        return moves
+
+    @staticmethod
+    def _route_locally(pdn_string):
+        """
+        Decides easy positions without Gemini. Returns (move, candidates): move is set when there is a
+        single legal move or the search finds one clearly better than the rest; otherwise candidates
+        lists the moves scoring within AI_ROUTING_MARGIN of the best, best first.
+        """
+        position = _parse_pdn(pdn_string)
+        moves = _legal_moves(position)
+        if not moves:
+            return None, []
+        if len(moves) == 1:
+            return _format_move(moves[0]), []
+
+        scored = _score_moves(position, moves, AI_SEARCH_DEPTH)
+        best_score = scored[0][0]
+        if best_score - scored[1][0] > AI_ROUTING_MARGIN:
+            return _format_move(scored[0][1]), []
+        return None, [_format_move(move) for score, move in scored if best_score - score <= AI_ROUTING_MARGIN]
+
+    @staticmethod
+    def _build_prompt(pdn_string, candidates=None):
+        """Builds the per-move user prompt; the rules live in the system instruction."""
+        if candidates:
+            return f"{pdn_string}\nChoose one: {', '.join(candidates)}\nBest move:"
+        return f"{pdn_string}\nBest move:"
 
+    async def _request_move(self, prompt, generation_config=None):
+        """
+        Requests a move from Gemini, retrying transient failures with jittered exponential backoff.
+        Returns None if the reply holds no move; other API errors, and the last transient one, are raised.
+        """
+        for attempt in range(REQUEST_MAX_ATTEMPTS):
+            try:
+                return await self._stream_move(prompt, generation_config)
+            except RETRYABLE_ERRORS as e:
+                if attempt == REQUEST_MAX_ATTEMPTS - 1:
+                    raise
+                delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt) + random.random() * 0.2
+                print(f"ERROR: Transient API error ({e}); retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def _stream_move(self, prompt, generation_config=None):
+        """
+        Streams a Gemini response and returns the first complete move in it, without waiting for the
+        rest of the generation. Returns None if the reply holds no move; API errors are raised.
+        """
+        response = await self.model.generate_content_async(
+            prompt, generation_config=generation_config, stream=True,
+            request_options={"timeout": REQUEST_TIMEOUT_SECONDS})
+
+        response_text = ""
+        async for chunk in response:
+            try:
+                response_text += chunk.text
+            except ValueError:
+                # Chunks without text only carry metadata such as the finish reason
+                continue
+            # A match touching the end of the buffer may still be missing digits from the next chunk
+            match = _MOVE_RE.search(response_text)
+            if match and match.end() < len(response_text):
+                return match.group(0)
+
+        match = _MOVE_RE.search(response_text)
+        if match:
+            return match.group(0)
+        if not response_text:
+            print(f"ERROR: Gemini response was blocked or empty. Feedback: {response.prompt_feedback}")
+        else:
+            print(f"ERROR: Could not find a valid move in AI response: '{response_text.strip()}'")
+        return None
+
+    @staticmethod
+    def _hash(pdn_string):
+        """Returns the cache key for a PDN string."""
+        return hashlib.md5(pdn_string.encode()).hexdigest()
+
+    def _get_cached_move(self, cache_key, pdn_string):
+        """
+        Returns the cached move for a key, marking it as recently used, or None on a miss. The cache
+        outlives runs and code changes, so an entry that is not legal in the position is dropped.
+        """
+        move = self._exact_cache.get(cache_key)
+        if not move:
+            return None
+        if not _is_legal_move(pdn_string, move):
+            print(f"ERROR: Dropping illegal cached move: {move}")
+            del self._exact_cache[cache_key]
+            self._save_cache()
+            return None
+        self._exact_cache.move_to_end(cache_key)
+        return move
+
+    def _cache_move(self, cache_key, move, persist=True):
+        """Stores a move in the LRU cache, evicting the oldest entry when full, and optionally persists it."""
+        self._exact_cache[cache_key] = move
+        self._exact_cache.move_to_end(cache_key)
+        if len(self._exact_cache) > CACHE_MAX_SIZE:
+            self._exact_cache.popitem(last=False)
+        if persist:
+            self._save_cache()
+
+    def _load_cache(self):
+        """Loads the persisted move cache, starting empty if it is missing or unreadable."""
+        try:
+            with open(CACHE_PATH, 'rb') as f:
+                return OrderedDict(pickle.load(f))
+        except FileNotFoundError:
+            return OrderedDict()
         except Exception as e:
-            print(f"ERROR: An API request error occurred: {e}")
-            return None
\ No newline at end of file
+            print(f"ERROR: Could not load AI move cache: {e}")
+            return OrderedDict()
+
+    def _save_cache(self):
+        """Writes the move cache to disk."""
+        try:
+            with open(CACHE_PATH, 'wb') as f:
+                pickle.dump(dict(self._exact_cache), f)
+        except OSError as e:
+            print(f"ERROR: Could not save AI move cache: {e}")
@@ -21,6 +21,7 @@ COLOR_BUTTON_HOVER = (150, 150, 150)
 # --- UI Layout ---
 # All UI elements are positioned relative to a starting point and a line height.
 UI_FONT_SIZE = 24
+TEXT_CACHE_SIZE = 256  # Rendered text surfaces kept between frames
 UI_START_Y = WINDOW_SIZE + 15
 UI_LINE_HEIGHT = 20
 
@@ -46,4 +47,18 @@ BUTTONS = [{
 }, {
     'name': 'Undo',
     'x': 340
-}]
\ No newline at end of file
+}]
+
+# --- AI ---
+# When enabled, the AI asks several times in parallel and plays the majority move
+AI_USE_ENSEMBLE = False
+AI_ENSEMBLE_SIZE = 3
+
+# After a failed AI request the next one waits this many seconds, doubling per consecutive failure
+AI_RETRY_DELAY = 1.0
+AI_RETRY_MAX_DELAY = 30.0
+
+# The AI's local search depth, and how close (in hundredths of a man) the best moves must score
+# before the choice is handed to Gemini
+AI_SEARCH_DEPTH = 4
+AI_ROUTING_MARGIN = 50
@@ -1,9 +1,50 @@
 # engine.py
 # Checkers game logic and state management
 
+import random
 import time
+from collections import Counter
 from config import BOARD_DIMENSION
-from pieces import Man, King
+from pieces import (Man, King, EMPTY, RED_MAN, RED_KING, BLACK_MAN, PIECE_MOVES,
+                    PIECE_JUMPS, NUM_SQUARES, RED_MAN_DIRECTIONS, BLACK_MAN_DIRECTIONS, is_player1, is_king,
+                    square_to_coords, coords_to_square, get_jump_destinations, shift_squares,
+                    iterate_squares)
+
+ALL_SQUARES = (1 << NUM_SQUARES) - 1
+
+# Zobrist keys: one random 64-bit value per (square, piece code - 1), plus one for black to move
+_zobrist_rng = random.Random(0xC4ECCE12)
+ZOBRIST = [[_zobrist_rng.getrandbits(64) for _ in range(4)] for _ in range(NUM_SQUARES)]
+ZOBRIST_TURN = _zobrist_rng.getrandbits(64)
+
+
+def generate_moves(men, kings, enemy, empty, player1):
+    """
+    Generate the legal moves for one side as (start_square, end_square) pairs from its men and kings
+    bitboards. In checkers, if a jump is available, it must be taken, so only jumps are returned then.
+    """
+    return generate_jumps(men, kings, enemy, empty, player1) or generate_simple_moves(men, kings, empty, player1)
+
+
+def generate_jumps(men, kings, enemy, empty, player1):
+    """Generate one side's jumps as (start_square, end_square) pairs."""
+    jumps = []
+    for piece, bitboard in ((Man(player1), men), (King(player1), kings)):
+        piece_jumps = PIECE_JUMPS[piece]
+        for square in iterate_squares(bitboard):
+            destinations = get_jump_destinations(piece_jumps[square], empty, enemy)
+            jumps.extend((square, end) for end in iterate_squares(destinations))
+    return jumps
+
+
+def generate_simple_moves(men, kings, empty, player1):
+    """Generate one side's non-capturing moves as (start_square, end_square) pairs."""
+    moves = []
+    for piece, bitboard in ((Man(player1), men), (King(player1), kings)):
+        piece_moves = PIECE_MOVES[piece]
+        for square in iterate_squares(bitboard):
+            moves.extend((square, end) for end in iterate_squares(piece_moves[square] & empty))
+    return moves
 
 
 class Player:
@@ -22,9 +63,9 @@ class Move:
                  piece_moved,
                  start_coords,
                  end_coords,
-                 piece_captured=None,
+                 piece_captured=EMPTY,
                  is_promotion=False,
-                 promoted_piece=None,
+                 promoted_piece=EMPTY,
                  turn_duration=0.0,
                  captured_coords=None):
         self.piece_moved = piece_moved
@@ -55,8 +96,14 @@ class Game:
     """The main game engine that manages checkers logic and state."""
 
     def __init__(self):
-        self.board = [[None for _ in range(BOARD_DIMENSION)]
-                      for _ in range(BOARD_DIMENSION)]
+        # The board is held as one bitboard per piece type over the 32 dark squares, mirrored by a
+        # byte-per-square array of piece codes (indexed row * 8 + col) for direct lookups
+        self.board = bytearray(BOARD_DIMENSION * BOARD_DIMENSION)
+        self.red_men = 0
+        self.red_kings = 0
+        self.black_men = 0
+        self.black_kings = 0
+        self.zobrist = 0
         self.players = [Player("Red", True), Player("Black", False)]
         self.current_player_index = 0
         self.game_state = 'active'
@@ -66,7 +113,11 @@ class Game:
         self.turn_start_time = time.time()
         self.red_turn_time = 0
         self.black_turn_time = 0
-        self.position_history = {}
+        self.position_history = Counter()
+        # Legal moves for the side to move, built on first query and reset whenever the board changes
+        self._moves_cache = None
+        # Whether the side to move has a jump, found in one bitboard pass and reset with the moves cache
+        self._has_jumps_cache = None
         self._place_pieces()
         self._update_position_history()
 
@@ -74,7 +125,7 @@ class Game:
         """Executes a move, assuming it has been pre-validated by the GUI."""
         piece_to_move = self.get_piece_at(start_coords)
 
-        if not piece_to_move or piece_to_move.is_player1 != self.get_current_player().is_player1:
+        if not piece_to_move or is_player1(piece_to_move) != self.get_current_player().is_player1:
             return False
 
         elapsed_time = time.time() - self.turn_start_time
@@ -87,16 +138,18 @@ class Game:
         if not self.move_history: 
             return
         move = self.move_history.pop()
+        self._moves_cache = None
+        self._has_jumps_cache = None
 
         # Restore the piece to its original position
         self.set_piece_at(move.start_coords, move.piece_moved)
         
         # If it was a promotion, demote back to Man
         if move.is_promotion:
-            self.set_piece_at(move.start_coords, Man(move.piece_moved.is_player1))
-            self.set_piece_at(move.end_coords, None)
+            self.set_piece_at(move.start_coords, Man(is_player1(move.piece_moved)))
+            self.set_piece_at(move.end_coords, EMPTY)
         else:
-            self.set_piece_at(move.end_coords, None)
+            self.set_piece_at(move.end_coords, EMPTY)
 
         # If there was a capture, restore the captured piece
         if move.piece_captured:
@@ -107,44 +160,54 @@ class Game:
                 self.set_piece_at((captured_row, captured_col), move.piece_captured)
             
             # Remove from captured pieces list
-            if move.piece_moved.is_player1: 
+            if is_player1(move.piece_moved):
                 self.black_captured.pop()
             else: 
                 self.red_captured.pop()
 
         # Restore time
-        if move.piece_moved.is_player1:
+        if is_player1(move.piece_moved):
             self.red_turn_time -= move.turn_duration
         else:
             self.black_turn_time -= move.turn_duration
 
         self.current_player_index = 1 - self.current_player_index
+        self.zobrist ^= ZOBRIST_TURN
         self.turn_start_time = time.time()
         self._update_game_status()
 
     def get_legal_moves_for_piece(self, coords):
         """Get all legal moves for a piece at the given coordinates."""
-        piece = self.get_piece_at(coords)
-        if not piece or piece.is_player1 != self.get_current_player().is_player1:
-            return []
-
-        # In checkers, if a jump is available, it must be taken
-        all_jumps = self._get_all_jumps_for_player(self.get_current_player())
-        
-        if all_jumps:
-            piece_jumps = [move for move in all_jumps if move[0] == coords]
-            return [move[1] for move in piece_jumps]  # Return only jump destinations
-        else:
-            # No jumps available, return regular moves
-            return piece.get_moves(self.board, coords, self.move_history)
+        return self._get_legal_moves().get(coords, [])
 
     def get_piece_at(self, coords):
-        """Get the piece at the given coordinates."""
-        return self.board[coords[0]][coords[1]]
+        """Get the piece code at the given coordinates (EMPTY if there is none)."""
+        return self.board[coords[0] * BOARD_DIMENSION + coords[1]]
 
     def set_piece_at(self, coords, piece):
-        """Set a piece at the given coordinates."""
-        self.board[coords[0]][coords[1]] = piece
+        """Set a piece code at the given coordinates, keeping the bitboards and Zobrist hash in sync."""
+        square = coords_to_square(coords)
+        bit = 1 << square
+        index = coords[0] * BOARD_DIMENSION + coords[1]
+        old_piece = self.board[index]
+        if old_piece:
+            self.zobrist ^= ZOBRIST[square][old_piece - 1]
+        self.red_men &= ~bit
+        self.red_kings &= ~bit
+        self.black_men &= ~bit
+        self.black_kings &= ~bit
+        self.board[index] = piece
+        if piece == EMPTY:
+            return
+        self.zobrist ^= ZOBRIST[square][piece - 1]
+        if piece == RED_MAN:
+            self.red_men |= bit
+        elif piece == RED_KING:
+            self.red_kings |= bit
+        elif piece == BLACK_MAN:
+            self.black_men |= bit
+        else:
+            self.black_kings |= bit
 
     def get_current_player(self):
         """Get the current player."""
@@ -163,45 +226,32 @@ class Game:
         """Generates a FEN string for the current board state using PDN standard."""
         turn = 'R' if self.get_current_player().is_player1 else 'B'
         
-        red_pieces = []
-        black_pieces = []
-
-        for r in range(BOARD_DIMENSION):
-            for c in range(BOARD_DIMENSION):
-                if (r + c) % 2 == 1: # Only playable squares
-                    square_num = (r * 4) + (c // 2) + 1
-                    piece = self.get_piece_at((r, c))
-                    if piece:
-                        piece_str = str(square_num)
-                        if isinstance(piece, King):
-                            piece_str = "K" + piece_str
-                        
-                        if piece.is_player1:
-                            red_pieces.append(piece_str)
-                        else:
-                            black_pieces.append(piece_str)
+        red_pieces = self._get_pdn_squares(self.red_men, self.red_kings)
+        black_pieces = self._get_pdn_squares(self.black_men, self.black_kings)
 
         return f"[{turn}:{','.join(red_pieces)}:{','.join(black_pieces)}]"
 
     # --- Helper Methods (reused and adapted from chess) ---
     def _place_pieces(self):
         """Place initial checkers pieces on the board."""
-        # Place black pieces (top of board)
-        for row in range(3):
-            for col in range(BOARD_DIMENSION):
-                if (row + col) % 2 == 1:  # Only on dark squares
-                    self.board[row][col] = Man(False)
-        
-        # Place red pieces (bottom of board)  
-        for row in range(5, 8):
-            for col in range(BOARD_DIMENSION):
-                if (row + col) % 2 == 1:  # Only on dark squares
-                    self.board[row][col] = Man(True)
+        # Place black pieces (top three rows, squares 0-11)
+        self.black_men = (1 << 12) - 1
+
+        # Place red pieces (bottom three rows, squares 20-31)
+        self.red_men = ((1 << 12) - 1) << 20
+
+        for piece, bitboard in ((BLACK_MAN, self.black_men), (RED_MAN, self.red_men)):
+            for square in self._iterate_squares(bitboard):
+                row, col = square_to_coords(square)
+                self.board[row * BOARD_DIMENSION + col] = piece
+                self.zobrist ^= ZOBRIST[square][piece - 1]
 
     def _execute_board_move(self, start_coords, end_coords, elapsed_time):
         """Execute the actual board move and return move details."""
+        self._moves_cache = None
+        self._has_jumps_cache = None
         piece = self.get_piece_at(start_coords)
-        captured_piece = None
+        captured_piece = EMPTY
         captured_coords = None
         
         # Check if this is a jump (capture)
@@ -211,30 +261,30 @@ class Game:
             captured_col = (start_coords[1] + end_coords[1]) // 2
             captured_coords = (captured_row, captured_col)
             captured_piece = self.get_piece_at(captured_coords)
-            self.set_piece_at(captured_coords, None)
+            self.set_piece_at(captured_coords, EMPTY)
 
         # Handle captured pieces
         if captured_piece:
-            if piece.is_player1: 
+            if is_player1(piece):
                 self.black_captured.append(captured_piece)
             else: 
                 self.red_captured.append(captured_piece)
 
         # Check for promotion
-        promoted_piece = None
+        promoted_piece = EMPTY
         is_promotion = False
-        if isinstance(piece, Man):
+        if not is_king(piece):
             # Red pieces promote when reaching row 0, black pieces when reaching row 7
-            if (piece.is_player1 and end_coords[0] == 0) or (not piece.is_player1 and end_coords[0] == 7):
+            if (is_player1(piece) and end_coords[0] == 0) or (not is_player1(piece) and end_coords[0] == 7):
                 is_promotion = True
-                promoted_piece = King(piece.is_player1)
+                promoted_piece = King(is_player1(piece))
                 self.set_piece_at(end_coords, promoted_piece)
             else:
                 self.set_piece_at(end_coords, piece)
         else:
             self.set_piece_at(end_coords, piece)
 
-        self.set_piece_at(start_coords, None)
+        self.set_piece_at(start_coords, EMPTY)
         
         return Move(piece, start_coords, end_coords, captured_piece,
                    is_promotion, promoted_piece, elapsed_time, captured_coords)
@@ -248,69 +298,112 @@ class Game:
             self.black_turn_time += move.turn_duration
         self.turn_start_time = time.time()
         self.current_player_index = 1 - self.current_player_index
+        self.zobrist ^= ZOBRIST_TURN
         self._update_position_history()
         self._update_game_status()
 
     def _update_game_status(self):
         """Update the current game status."""
         # Check for threefold repetition (reused logic)
-        if self.position_history.get(self._get_position_hash(), 0) >= 3:
+        if self.position_history[self._get_position_hash()] >= 3:
             self.game_state = 'draw by threefold repetition'
             return
 
         player = self.get_current_player()
         
         # Check if opponent has any pieces left
-        opponent_pieces = 0
-        for r, c in self._iterate_squares():
-            piece = self.get_piece_at((r, c))
-            if piece and piece.is_player1 != player.is_player1:
-                opponent_pieces += 1
-        
-        if opponent_pieces == 0:
+        if not self._get_side_bitboards(not player.is_player1):
             self.game_state = f'{player.color.title()} wins - All opponent pieces captured'
             return
 
         # Check if player has any legal moves
-        has_legal_move = False
-        for r, c in self._iterate_squares():
-            piece = self.get_piece_at((r, c))
-            if piece and piece.is_player1 == player.is_player1:
-                if self.get_legal_moves_for_piece((r, c)):
-                    has_legal_move = True
-                    break
-
-        if not has_legal_move:
+        if not self._any_legal_move():
             winner = "Black" if player.is_player1 else "Red"
             self.game_state = f'{winner} wins - no legal moves'
         else:
             self.game_state = 'active'
 
-    def _get_all_jumps_for_player(self, player):
-        """Get all possible jumps for a player."""
-        jumps = []
-        for r, c in self._iterate_squares():
-            piece = self.get_piece_at((r, c))
-            if piece and piece.is_player1 == player.is_player1:
-                piece_moves = piece.get_moves(self.board, (r, c), self.move_history)
-                for move_coords in piece_moves:
-                    if abs(r - move_coords[0]) == 2:  # This is a jump
-                        jumps.append(((r, c), move_coords))
-        return jumps
+    def _get_legal_moves(self):
+        """
+        Get the legal moves for every piece of the current player as a dict mapping start coordinates
+        to destination coordinates. All pieces are generated in one pass and cached until the next
+        move or undo, so repeated per-piece queries within a ply are dictionary lookups.
+        """
+        if self._moves_cache is not None:
+            return self._moves_cache
+
+        player = self.get_current_player()
+        men, kings, _, _ = self._get_side_pieces(player)
+        empty = self._get_empty_squares()
+        if self._has_jumps():
+            enemy = self._get_side_bitboards(not player.is_player1)
+            moves = generate_jumps(men, kings, enemy, empty, player.is_player1)
+        else:
+            moves = generate_simple_moves(men, kings, empty, player.is_player1)
+
+        self._moves_cache = {}
+        for start, end in moves:
+            self._moves_cache.setdefault(square_to_coords(start), []).append(square_to_coords(end))
+        return self._moves_cache
+
+    def _has_jumps(self):
+        """
+        Check whether the current player has a jump, and so must jump, by stepping whole bitboards one
+        direction at a time. The answer is cached until the next move or undo.
+        """
+        if self._has_jumps_cache is None:
+            player = self.get_current_player()
+            men, kings, forward, backward = self._get_side_pieces(player)
+            empty = self._get_empty_squares()
+            enemy = self._get_side_bitboards(not player.is_player1)
+            # Men and kings both jump forward; only kings jump backward
+            self._has_jumps_cache = any(
+                shift_squares(shift_squares(pieces, direction) & enemy, direction) & empty
+                for pieces, directions in ((men | kings, forward), (kings, backward))
+                for direction in directions)
+        return self._has_jumps_cache
+
+    def _any_legal_move(self):
+        """Check whether the current player has any move or jump without generating the moves."""
+        if self._has_jumps():
+            return True
+        men, kings, forward, backward = self._get_side_pieces(self.get_current_player())
+        empty = self._get_empty_squares()
+        return any(shift_squares(pieces, direction) & empty
+                   for pieces, directions in ((men | kings, forward), (kings, backward))
+                   for direction in directions)
+
+    def _get_side_pieces(self, player):
+        """Get the player's men and kings bitboards with their forward and backward directions."""
+        if player.is_player1:
+            return self.red_men, self.red_kings, RED_MAN_DIRECTIONS, BLACK_MAN_DIRECTIONS
+        return self.black_men, self.black_kings, BLACK_MAN_DIRECTIONS, RED_MAN_DIRECTIONS
+
+    def _get_side_bitboards(self, is_player1):
+        """Get a bitboard of every piece belonging to one side."""
+        if is_player1:
+            return self.red_men | self.red_kings
+        return self.black_men | self.black_kings
+
+    def _get_empty_squares(self):
+        """Get a bitboard of the unoccupied dark squares."""
+        occupied = self.red_men | self.red_kings | self.black_men | self.black_kings
+        return ~occupied & ALL_SQUARES
 
     def _get_position_hash(self):
-        """Generate a hash for the current position (reused from chess)."""
-        board_str = "".join(p.name + p.color[0] if p else ' ' 
-                           for r in self.board for p in r)
-        return board_str + str(self.current_player_index)
+        """Get the Zobrist hash of the current position, maintained incrementally on every move."""
+        return self.zobrist
 
     def _update_position_history(self):
         """Update position history for repetition detection (reused from chess)."""
-        pos_hash = self._get_position_hash()
-        self.position_history[pos_hash] = self.position_history.get(pos_hash, 0) + 1
-
-    def _iterate_squares(self):
-        """Iterator for all board squares (reused from chess)."""
-        for r in range(BOARD_DIMENSION):
-            for c in range(BOARD_DIMENSION):
-                yield r, c
\ No newline at end of file
+        self.position_history[self._get_position_hash()] += 1
+
+    def _get_pdn_squares(self, men, kings):
+        """List one side's PDN square numbers in ascending order, prefixing kings with 'K'."""
+        return [f"K{square + 1}" if kings >> square & 1 else str(square + 1)
+                for square in self._iterate_squares(men | kings)]
+
+    @staticmethod
+    def _iterate_squares(bitboard):
+        """Iterator for the square index of every set bit in a bitboard."""
+        return iterate_squares(bitboard)
\ No newline at end of file
@@ -1,14 +1,21 @@
 # gui.py
 # Graphical user interface using Pygame
 
+import asyncio
 import pygame
+import re
 import sys
 import time
-import threading
+from collections import OrderedDict
 from config import *
-from engine import Game, King
+from engine import Game
+from pieces import is_player1, is_king
 from ai import AIPlayer
 
+# A PDN move such as '11-15', with nothing else around it
+_PDN_MOVE_RE = re.compile(r'^\s*(\d{1,2})-(\d{1,2})\s*$')
+
+
 class CheckersGUI:
     """Manages the graphical user interface using Pygame."""
     def __init__(self):
@@ -17,6 +24,14 @@ class CheckersGUI:
         pygame.display.set_caption("Checkers Game")
         self.font = pygame.font.Font(None, 64)
         self.ui_font = pygame.font.Font(None, UI_FONT_SIZE)
+        # Rendered text surfaces keyed by (text, color), reused until the text changes
+        self._text_cache = OrderedDict()
+        self.board_bg = self._render_board_background()
+        # Screen regions redrawn this frame, passed to pygame.display.update instead of flipping the whole window
+        self.dirty = []
+        # What each region showed when last drawn, so unchanged regions can be skipped
+        self._drawn_squares = None
+        self._drawn_ui = {}
         self.game = Game()
         
         self.selected_square = None
@@ -32,8 +47,12 @@ class CheckersGUI:
         self.black_player = self._create_player(self.black_player_type)
         
         self.ai_is_thinking = False
-        self.ai_move_result = None
-        self.ai_lock = threading.Lock()
+        self.ai_task = None
+        # Consecutive failed AI requests, and the time before which the next one must not start
+        self.ai_failures = 0
+        self.ai_retry_at = 0
+        # A single event loop drives the AI's network calls; it is stepped once per frame.
+        self.loop = asyncio.new_event_loop()
 
     def _create_player(self, player_type):
         """Helper function to create and return an AI player object."""
@@ -46,12 +65,16 @@ class CheckersGUI:
         clock = pygame.time.Clock()
         while True:
             self._handle_ai_turn_start()
+            self._step_event_loop()
             self._process_ai_result()
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    self._shutdown_event_loop()
                     pygame.quit()
                     sys.exit()
+                if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                    self._invalidate_screen()
                 
                 is_human_turn = (self.game.get_current_player().color == 'red' and self.white_player is None) or \
                                 (self.game.get_current_player().color == 'black' and self.black_player is None)
@@ -60,7 +83,8 @@ class CheckersGUI:
                     self.handle_input(event)
 
             self.draw()
-            pygame.display.flip()
+            pygame.display.update(self.dirty)
+            self.dirty.clear()
             clock.tick(60)
 
     def _handle_ai_turn_start(self):
@@ -69,39 +93,77 @@ class CheckersGUI:
         
         is_ai_turn = (current_player_object is not None and 
                       not self.ai_is_thinking and 
-                      self.game.game_state == 'active')
+                      self.game.game_state == 'active' and
+                      time.time() >= self.ai_retry_at)
 
         if is_ai_turn:
             self.ai_is_thinking = True
-            thread = threading.Thread(target=self._get_ai_move_threaded, args=(current_player_object,))
-            thread.start()
+            self.ai_task = self.loop.create_task(self._get_ai_move(current_player_object))
 
-    def _get_ai_move_threaded(self, ai_player):
-        """This function runs in a separate thread to get the AI's move."""
+    async def _get_ai_move(self, ai_player):
+        """Coroutine run on the GUI's event loop to get the AI's move."""
         pdn = self.game.to_pdn()
-        move = ai_player.get_best_move(pdn)
-        with self.ai_lock:
-            self.ai_move_result = move
+        if AI_USE_ENSEMBLE:
+            return await ai_player.get_best_move_ensemble(pdn, AI_ENSEMBLE_SIZE)
+        return await ai_player.get_best_move(pdn)
+
+    def _step_event_loop(self):
+        """Runs one iteration of the event loop so pending AI I/O progresses without blocking the frame."""
+        self.loop.call_soon(self.loop.stop)
+        self.loop.run_forever()
+
+    def _shutdown_event_loop(self):
+        """Cancels any pending AI request and closes the event loop."""
+        self._cancel_ai_task()
+        self.loop.close()
+
+    def _cancel_ai_task(self):
+        """Cancels an in-flight AI request so its result is never applied."""
+        if self.ai_task is not None:
+            self.ai_task.cancel()
+            # A cancelled streaming call can take several loop steps to unwind; wait for it to finish
+            self.loop.run_until_complete(asyncio.gather(self.ai_task, return_exceptions=True))
+            self.ai_task = None
+        self.ai_is_thinking = False
 
     def _process_ai_result(self):
-        """Checks if the AI thread has finished and, if so, processes the resulting move."""
-        move_to_make = None
-        with self.ai_lock:
-            if self.ai_move_result is not None:
-                move_to_make = self.ai_move_result
-                self.ai_move_result = None
-        
+        """Checks if the AI task has finished and, if so, processes the resulting move."""
+        if self.ai_task is None or not self.ai_task.done():
+            return
+        task, self.ai_task = self.ai_task, None
+        # Every finished request ends the AI's turn to think, whatever it returned
+        self.ai_is_thinking = False
+        # Read the exception first so a failed request is reported instead of raised into the game loop
+        error = task.exception()
+        if error is not None:
+            print(f"ERROR: AI move request failed: {error}")
+            self._record_ai_failure()
+            return
+        move_to_make = task.result()
+
         if move_to_make:
             start_coords, end_coords = self._parse_ai_move(move_to_make)
             if start_coords and end_coords:
                 if end_coords in self.game.get_legal_moves_for_piece(start_coords):
                     self.game.make_move(start_coords, end_coords)
-                else:
-                    print(f"ERROR: AI suggested an illegal move: {move_to_make}")
+                    self._clear_ai_failures()
+                    return
+                print(f"ERROR: AI suggested an illegal move: {move_to_make}")
             else:
                 print(f"ERROR: AI response '{move_to_make}' could not be parsed.")
-            
-            self.ai_is_thinking = False
+        self._record_ai_failure()
+
+    def _record_ai_failure(self):
+        """Holds off the next AI request, doubling the wait after each consecutive failure."""
+        delay = min(AI_RETRY_MAX_DELAY, AI_RETRY_DELAY * 2 ** self.ai_failures)
+        self.ai_failures += 1
+        self.ai_retry_at = time.time() + delay
+        print(f"ERROR: Retrying the AI move in {delay:.0f}s")
+
+    def _clear_ai_failures(self):
+        """Lets the next AI request start immediately."""
+        self.ai_failures = 0
+        self.ai_retry_at = 0
 
     def handle_input(self, event):
         if event.type == pygame.MOUSEMOTION: self.hovered_button = self._get_button_at(pygame.mouse.get_pos())
@@ -123,7 +185,7 @@ class CheckersGUI:
             self._reset_ui_state()
         else:
             piece = self.game.get_piece_at(coords)
-            if piece and piece.is_player1 == self.game.get_current_player().is_player1:
+            if piece and is_player1(piece) == self.game.get_current_player().is_player1:
                 self.selected_square = coords
                 self.legal_moves = self.game.get_legal_moves_for_piece(coords)
             else:
@@ -136,67 +198,129 @@ class CheckersGUI:
         elif button_name == 'Undo': self._undo_move()
 
     def draw(self):
-        self.screen.fill(COLOR_WHITE)
-        self.draw_board(); self.draw_highlights(); self.draw_pieces(); self.draw_ui()
+        """Redraws the squares and UI lines that changed since the last frame, recording them in self.dirty."""
+        if self._drawn_squares is None:
+            self.screen.fill(COLOR_WHITE)
+            self.dirty.append(self.screen.get_rect())
+        squares = self._get_changed_squares()
+        self.draw_board(squares); self.draw_highlights(squares); self.draw_pieces(squares); self.draw_ui()
 
-    def draw_board(self):
+    def _invalidate_screen(self):
+        """Forces the whole window to be redrawn on the next frame."""
+        self._drawn_squares = None
+        self._drawn_ui = {}
+
+    def _get_changed_squares(self):
+        """Returns the board indexes whose piece or highlight differs from what was last drawn."""
+        highlights = bytearray(len(self.game.board))
+        for r, c in self.legal_moves: highlights[r * BOARD_DIMENSION + c] = 2
+        if self.selected_square:
+            r, c = self.selected_square
+            highlights[r * BOARD_DIMENSION + c] = 1
+        squares = bytes(self.game.board) + bytes(highlights)
+        drawn, self._drawn_squares = self._drawn_squares, squares
+        if drawn is None:
+            return range(len(self.game.board))
+        if drawn == squares:
+            return ()
+        count = len(self.game.board)
+        return [i for i in range(count) if drawn[i] != squares[i] or drawn[count + i] != squares[count + i]]
+
+    def _square_rect(self, index):
+        r, c = divmod(index, BOARD_DIMENSION)
+        return pygame.Rect(c * SQUARE_SIZE, r * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE)
+
+    def draw_board(self, squares):
+        for index in squares:
+            rect = self._square_rect(index)
+            self.screen.blit(self.board_bg, rect, rect)
+            self.dirty.append(rect)
+
+    def _render_board_background(self):
+        """Draws the squares once onto a surface that draw_board copies from."""
+        surface = pygame.Surface((WINDOW_SIZE, WINDOW_SIZE)).convert()
         for r in range(BOARD_DIMENSION):
             for c in range(BOARD_DIMENSION):
                 color = COLOR_LIGHT_SQUARE if (r + c) % 2 == 0 else COLOR_DARK_SQUARE
-                pygame.draw.rect(self.screen, color, (c * SQUARE_SIZE, r * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
+                pygame.draw.rect(surface, color, (c * SQUARE_SIZE, r * SQUARE_SIZE, SQUARE_SIZE, SQUARE_SIZE))
+        return surface
 
-    def draw_highlights(self):
+    def draw_highlights(self, squares):
         if not self.selected_square: return
-        r, c = self.selected_square
         s = pygame.Surface((SQUARE_SIZE, SQUARE_SIZE), pygame.SRCALPHA)
-        s.fill(COLOR_HIGHLIGHT); self.screen.blit(s, (c * SQUARE_SIZE, r * SQUARE_SIZE))
-        s.fill(COLOR_LEGAL_MOVE)
-        for r_m, c_m in self.legal_moves: self.screen.blit(s, (c_m * SQUARE_SIZE, r_m * SQUARE_SIZE))
+        for color, targets in ((COLOR_HIGHLIGHT, [self.selected_square]), (COLOR_LEGAL_MOVE, self.legal_moves)):
+            s.fill(color)
+            for r, c in targets:
+                if r * BOARD_DIMENSION + c in squares: self.screen.blit(s, (c * SQUARE_SIZE, r * SQUARE_SIZE))
 
-    def draw_pieces(self):
-        for r in range(BOARD_DIMENSION):
-            for c in range(BOARD_DIMENSION):
-                piece = self.game.board[r][c]
-                if piece:
-                    # Draw the piece as a circle
-                    color = COLOR_RED if piece.is_player1 else COLOR_BLACK
-                    pygame.draw.circle(self.screen, color, (c * SQUARE_SIZE + SQUARE_SIZE // 2, r * SQUARE_SIZE + SQUARE_SIZE // 2), PIECE_RADIUS)
-                    # Draw a crown for kings
-                    if isinstance(piece, King):
-                        crown_surf = self.ui_font.render('K', True, COLOR_WHITE)
-                        crown_rect = crown_surf.get_rect(center=(c * SQUARE_SIZE + SQUARE_SIZE // 2, r * SQUARE_SIZE + SQUARE_SIZE // 2))
-                        self.screen.blit(crown_surf, crown_rect)
+    def draw_pieces(self, squares):
+        for index in squares:
+            piece = self.game.board[index]
+            if piece:
+                r, c = divmod(index, BOARD_DIMENSION)
+                # Draw the piece as a circle
+                color = COLOR_RED if is_player1(piece) else COLOR_BLACK
+                pygame.draw.circle(self.screen, color, (c * SQUARE_SIZE + SQUARE_SIZE // 2, r * SQUARE_SIZE + SQUARE_SIZE // 2), PIECE_RADIUS)
+                # Draw a crown for kings
+                if is_king(piece):
+                    crown_surf = self._text('K', COLOR_WHITE)
+                    crown_rect = crown_surf.get_rect(center=(c * SQUARE_SIZE + SQUARE_SIZE // 2, r * SQUARE_SIZE + SQUARE_SIZE // 2))
+                    self.screen.blit(crown_surf, crown_rect)
 
     def draw_ui(self):
         red_cap_str = f"Red captured: {len(self.game.black_captured)}"
         black_cap_str = f"Black captured: {len(self.game.red_captured)}"
-        self.screen.blit(self.ui_font.render(red_cap_str, True, COLOR_BLACK), (10, CAPTURED_ROW_Y))
-        self.screen.blit(self.ui_font.render(black_cap_str, True, COLOR_BLACK), (10, CAPTURED_ROW_Y + UI_LINE_HEIGHT))
+        self._draw_ui_line(CAPTURED_ROW_Y, (red_cap_str, 10))
+        self._draw_ui_line(CAPTURED_ROW_Y + UI_LINE_HEIGHT, (black_cap_str, 10))
         last_move_str = f"Last Move: {self.game.move_history[-1].to_notation()}" if self.game.move_history else "Last Move: None"
-        self.screen.blit(self.ui_font.render(last_move_str, True, COLOR_BLACK), (10, LAST_MOVE_ROW_Y))
+        self._draw_ui_line(LAST_MOVE_ROW_Y, (last_move_str, 10))
         red_time, black_time = self._get_display_times()
-        self.screen.blit(self.ui_font.render(f"Red: {red_time}", True, COLOR_BLACK), (10, TIMER_ROW_Y))
-        self.screen.blit(self.ui_font.render(f"Black: {black_time}", True, COLOR_BLACK), (200, TIMER_ROW_Y))
+        self._draw_ui_line(TIMER_ROW_Y, (f"Red: {red_time}", 10), (f"Black: {black_time}", 200))
         player_color = self.game.get_current_player().color.title()
         status_text = f"{player_color}'s Turn | {self.game.game_state.title()}"
         if self.ai_is_thinking: 
             current_ai_type = self.white_player_type if self.game.get_current_player().color == 'red' else self.black_player_type
             status_text = f"{current_ai_type.title()} is thinking..."
-        self.screen.blit(self.ui_font.render(status_text, True, COLOR_BLACK), (10, STATUS_ROW_Y))
+        self._draw_ui_line(STATUS_ROW_Y, (status_text, 10))
         for button in BUTTONS:
+            is_hovered = self.hovered_button == button['name']
+            if self._drawn_ui.get(button['name']) == is_hovered: continue
+            self._drawn_ui[button['name']] = is_hovered
             rect = pygame.Rect(button['x'], BUTTON_ROW_Y, BUTTON_WIDTH, BUTTON_HEIGHT)
-            color = COLOR_BUTTON_HOVER if self.hovered_button == button['name'] else COLOR_BUTTON
+            color = COLOR_BUTTON_HOVER if is_hovered else COLOR_BUTTON
             pygame.draw.rect(self.screen, color, rect)
-            text_surf = self.ui_font.render(button['name'], True, COLOR_BLACK)
+            text_surf = self._text(button['name'])
             self.screen.blit(text_surf, text_surf.get_rect(center=rect.center))
+            self.dirty.append(rect)
+
+    def _draw_ui_line(self, y, *texts):
+        """Redraws one row of UI text, given as (text, x) pairs, if it differs from what is on screen."""
+        if self._drawn_ui.get(y) == texts: return
+        self._drawn_ui[y] = texts
+        rect = pygame.Rect(0, y, WINDOW_SIZE, UI_LINE_HEIGHT)
+        self.screen.fill(COLOR_WHITE, rect)
+        for text, x in texts: self.screen.blit(self._text(text), (x, y))
+        self.dirty.append(rect)
+
+    def _text(self, text, color=COLOR_BLACK):
+        """Renders UI text, reusing the surface from an earlier frame when the same string was drawn."""
+        key = (text, color)
+        surface = self._text_cache.get(key)
+        if surface is None:
+            surface = self.ui_font.render(text, True, color)
+            self._text_cache[key] = surface
+            if len(self._text_cache) > TEXT_CACHE_SIZE:
+                self._text_cache.popitem(last=False)
+        else:
+            self._text_cache.move_to_end(key)
+        return surface
 
     def _parse_ai_move(self, move_str):
-        try:
-            start_sq, end_sq = map(int, move_str.split('-'))
-            start_coords = self._square_to_coords(start_sq)
-            end_coords = self._square_to_coords(end_sq)
+        match = _PDN_MOVE_RE.match(move_str)
+        if match:
+            start_coords = self._square_to_coords(int(match.group(1)))
+            end_coords = self._square_to_coords(int(match.group(2)))
             return (start_coords, end_coords)
-        except (ValueError, IndexError): pass
         print(f"ERROR: Could not parse AI move string: '{move_str}'")
         return None, None
 
@@ -220,7 +344,7 @@ class CheckersGUI:
         return format_time(r_time), format_time(b_time)
 
     def _reset_ui_state(self): self.selected_square = None; self.legal_moves = []
-    def _reset_game_state(self): self.game = Game(); self._reset_ui_state()
+    def _reset_game_state(self): self._cancel_ai_task(); self._clear_ai_failures(); self.game = Game(); self._reset_ui_state()
     def _undo_move(self):
         is_h_vs_ai = (self.white_player is None and self.black_player is not None) or \
                      (self.white_player is not None and self.black_player is None)
@@ -228,4 +352,5 @@ class CheckersGUI:
         self.game.undo_last_move()
         if is_h_vs_ai:
             self.game.undo_last_move()
+        self._clear_ai_failures()
         self._reset_ui_state()
@@ -1,71 +1,164 @@
 # pieces.py
-# Checkers piece classes
+# Checkers piece codes and precomputed movement tables
 
 from config import BOARD_DIMENSION
 
+# --- Square Geometry ---
+# The 32 playable (dark) squares are indexed 0-31, which is the PDN square number minus one.
+# Square n is bit (1 << n) in the engine's bitboards.
+SQUARES_PER_ROW = BOARD_DIMENSION // 2
+NUM_SQUARES = BOARD_DIMENSION * SQUARES_PER_ROW
 
-class Piece:
-    """Base class for all checkers pieces."""
-
-    def __init__(self, name, is_player1):
-        self.name = name
-        self.is_player1 = is_player1
-        self.color = 'red' if is_player1 else 'black'
-
-    def get_moves(self, board, start_coords, move_history=None):
-        """Base method to be overridden by subclasses."""
-        return []
-
-    def is_enemy(self, other_piece):
-        """Check if another piece is an enemy."""
-        return other_piece is not None and other_piece.is_player1 != self.is_player1
-
-    def _get_diagonal_moves(self, board, start_coords, directions):
-        """Helper method to get moves for diagonal movement."""
-        moves = []
-        row, col = start_coords
-        
-        for dr, dc in directions:
-            new_row, new_col = row + dr, col + dc
-            
-            # Check for a regular move
-            if 0 <= new_row < BOARD_DIMENSION and 0 <= new_col < BOARD_DIMENSION:
-                target = board[new_row][new_col]
-                if target is None:
-                    moves.append((new_row, new_col))
-                # Check for a capture
-                elif self.is_enemy(target):
-                    jump_row, jump_col = new_row + dr, new_col + dc
-                    if (0 <= jump_row < BOARD_DIMENSION and 0 <= jump_col < BOARD_DIMENSION 
-                        and board[jump_row][jump_col] is None):
-                        moves.append((jump_row, jump_col))
-        return moves
-
-
-class Man(Piece):
-    """Regular checkers piece that moves diagonally forward only."""
 
-    def __init__(self, is_player1):
-        super().__init__('M', is_player1)
+# Lookup tables between square indices and board coordinates; light squares map to -1
+SQUARE_COORDS = tuple(
+    (square // SQUARES_PER_ROW, (square % SQUARES_PER_ROW) * 2 + (1 - square // SQUARES_PER_ROW % 2))
+    for square in range(NUM_SQUARES))
+COORDS_SQUARE = [-1] * (BOARD_DIMENSION * BOARD_DIMENSION)
+for _square, (_row, _col) in enumerate(SQUARE_COORDS):
+    COORDS_SQUARE[_row * BOARD_DIMENSION + _col] = _square
+COORDS_SQUARE = tuple(COORDS_SQUARE)
 
-    def get_moves(self, board, start_coords, move_history=None):
-        # Player1 (red) moves up the board (decreasing row numbers)
-        # Player2 (black) moves down the board (increasing row numbers)
-        if self.is_player1:
-            directions = [(-1, -1), (-1, 1)]  # Forward diagonals for player1
-        else:
-            directions = [(1, -1), (1, 1)]   # Forward diagonals for player2
-        
-        return self._get_diagonal_moves(board, start_coords, directions)
 
+def square_to_coords(square):
+    """Convert a square index (0-31) into (row, col) board coordinates."""
+    return SQUARE_COORDS[square]
+
+
+def coords_to_square(coords):
+    """Convert (row, col) board coordinates into a square index, or -1 for a light square."""
+    return COORDS_SQUARE[coords[0] * BOARD_DIMENSION + coords[1]]
+
+
+# --- Movement Tables ---
+# Diagonal directions are referred to by index into DIRECTIONS
+DIRECTIONS = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+RED_MAN_DIRECTIONS = (0, 1)  # Player1 (red) moves up the board (decreasing row numbers)
+BLACK_MAN_DIRECTIONS = (2, 3)  # Player2 (black) moves down the board (increasing row numbers)
+KING_DIRECTIONS = (0, 1, 2, 3)
+
+
+def _step(square, direction, distance):
+    """Return the square reached by moving a distance along a direction, or -1 if it is off the board."""
+    row, col = SQUARE_COORDS[square]
+    dr, dc = DIRECTIONS[direction]
+    new_row, new_col = row + dr * distance, col + dc * distance
+    if 0 <= new_row < BOARD_DIMENSION and 0 <= new_col < BOARD_DIMENSION:
+        return COORDS_SQUARE[new_row * BOARD_DIMENSION + new_col]
+    return -1
+
+
+# NEIGHBORS[square][direction] is the adjacent square and JUMP_TARGET[square][direction] the square
+# two steps away, with -1 where the step leaves the board. All bounds checks happen here, once.
+NEIGHBORS = tuple(tuple(_step(square, d, 1) for d in range(len(DIRECTIONS))) for square in range(NUM_SQUARES))
+JUMP_TARGET = tuple(tuple(_step(square, d, 2) for d in range(len(DIRECTIONS))) for square in range(NUM_SQUARES))
+
+
+def _build_direction_shifts(direction):
+    """
+    Group the squares by how far their index moves when stepping in a direction, returning
+    (source_mask, delta) pairs. Row parity means each direction has at most two distinct deltas.
+    """
+    shifts = {}
+    for square in range(NUM_SQUARES):
+        neighbor = NEIGHBORS[square][direction]
+        if neighbor >= 0:
+            shifts[neighbor - square] = shifts.get(neighbor - square, 0) | 1 << square
+    return tuple((source_mask, delta) for delta, source_mask in shifts.items())
+
+
+DIRECTION_SHIFTS = tuple(_build_direction_shifts(d) for d in range(len(DIRECTIONS)))
+
+
+def shift_squares(bitboard, direction):
+    """Step every set square of a bitboard one square in a direction, dropping any that leave the board."""
+    shifted = 0
+    for source_mask, delta in DIRECTION_SHIFTS[direction]:
+        moved = bitboard & source_mask
+        shifted |= moved << delta if delta > 0 else moved >> -delta
+    return shifted
+
+
+def iterate_squares(bitboard):
+    """Iterator for the square index of every set bit in a bitboard."""
+    while bitboard:
+        low_bit = bitboard & -bitboard
+        yield low_bit.bit_length() - 1
+        bitboard ^= low_bit
 
-class King(Piece):
-    """King checkers piece that can move diagonally in all directions."""
 
-    def __init__(self, is_player1):
-        super().__init__('K', is_player1)
+# The square jumped over for each (start_square, landing_square) jump
+JUMPED_SQUARE = {
+    (square, JUMP_TARGET[square][d]): NEIGHBORS[square][d]
+    for square in range(NUM_SQUARES) for d in range(len(DIRECTIONS)) if JUMP_TARGET[square][d] >= 0
+}
 
-    def get_moves(self, board, start_coords, move_history=None):
-        # Kings can move in all diagonal directions
-        directions = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
-        return self._get_diagonal_moves(board, start_coords, directions)
\ No newline at end of file
+
+def _build_move_tables(directions):
+    """
+    Precompute, for every square, a mask of the squares reachable by a simple move and a tuple of
+    (captured_mask, landing_mask) pairs for the jumps available in the given directions.
+    """
+    moves = []
+    jumps = []
+    for square in range(NUM_SQUARES):
+        move_mask = 0
+        square_jumps = []
+        for direction in directions:
+            neighbor = NEIGHBORS[square][direction]
+            if neighbor < 0:
+                continue
+            move_mask |= 1 << neighbor
+            target = JUMP_TARGET[square][direction]
+            if target >= 0:
+                square_jumps.append((1 << neighbor, 1 << target))
+        moves.append(move_mask)
+        jumps.append(tuple(square_jumps))
+    return tuple(moves), tuple(jumps)
+
+
+MAN_MOVES_RED, MAN_JUMPS_RED = _build_move_tables(RED_MAN_DIRECTIONS)
+MAN_MOVES_BLACK, MAN_JUMPS_BLACK = _build_move_tables(BLACK_MAN_DIRECTIONS)
+KING_MOVES, KING_JUMPS = _build_move_tables(KING_DIRECTIONS)
+
+
+def get_jump_destinations(square_jumps, empty, enemy):
+    """Return the mask of landing squares for a square's jumps, given the empty and enemy bitboards."""
+    destinations = 0
+    for captured_mask, landing_mask in square_jumps:
+        if enemy & captured_mask and empty & landing_mask:
+            destinations |= landing_mask
+    return destinations
+
+
+# --- Piece Codes ---
+# Pieces are small integers so a board square is a single byte; 0 means the square is empty.
+EMPTY = 0
+RED_MAN = 1
+RED_KING = 2
+BLACK_MAN = 3
+BLACK_KING = 4
+
+# Movement tables indexed by piece code
+PIECE_MOVES = (None, MAN_MOVES_RED, KING_MOVES, MAN_MOVES_BLACK, KING_MOVES)
+PIECE_JUMPS = (None, MAN_JUMPS_RED, KING_JUMPS, MAN_JUMPS_BLACK, KING_JUMPS)
+
+
+def is_player1(piece):
+    """Check if a piece code belongs to player1 (red)."""
+    return piece == RED_MAN or piece == RED_KING
+
+
+def is_king(piece):
+    """Check if a piece code is a king."""
+    return piece == RED_KING or piece == BLACK_KING
+
+
+def Man(is_player1):
+    """Regular checkers piece that moves diagonally forward only."""
+    return RED_MAN if is_player1 else BLACK_MAN
+
+
+def King(is_player1):
+    """King checkers piece that can move diagonally in all directions."""
+    return RED_KING if is_player1 else BLACK_KING